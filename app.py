@@ -1,20 +1,57 @@
 import os
 import io
-import json
 import hmac
+import queue
+import time
+import zlib
 import base64
+import struct
+import threading
 import hashlib
-from datetime import datetime
+import functools
 from typing import Optional, Dict, Any
 
+import orjson
 import requests
-from flask import Flask, request, send_file, jsonify, render_template_string, abort
-from flask_cors import CORS
+from cachetools import LRUCache, TTLCache
+from flask import Flask, request, send_file, jsonify, abort, url_for
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException, ServiceUnavailable
 
 import qrcode
 import qrcode.image.svg as qrcode_svg
 
-app = Flask(__name__)
+
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    Provider JSON basé sur orjson (Rust) : ~5x plus rapide que le module `json`
+    standard. Tous les `jsonify(...)`, les `return {...}` et `request.get_json()`
+    passent par ici.
+    """
+
+    options = orjson.OPT_NON_STR_KEYS  # tolère les clés int (comme `json`)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default, option=self.options).decode()
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        # Écrit directement les bytes d'orjson (pas d'aller-retour str)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.options), mimetype=self.mimetype
+        )
+
+class App(Flask):
+    json_provider_class = ORJSONProvider
+
+app = App(__name__)
+# Routage allégé : pas de redirection 308 sur le slash final, pas d'OPTIONS
+# automatique sur chaque route (le preflight CORS des routes /api a sa propre vue)
+app.url_map.strict_slashes = False
+app.config["PROVIDE_AUTOMATIC_OPTIONS"] = False
 
 # ───────────────────────── Config / ENV ─────────────────────────
 # ENV: "live" | "sandbox"
@@ -40,19 +77,86 @@ FEDAPAY_API_BASE = os.getenv(
 # URL de retour (front) après paiement — configure ton domaine ici (ex: https://ton-front.com/retour.html)
 CALLBACK_URL = os.getenv("CALLBACK_URL", "https://ton-front.com/retour")
 
+# URL publique de ce backend (ex: https://api.ton-domaine.com) — préfixe de `qr_url`.
+# Configurée, jamais déduite de la requête (Host / X-Forwarded-Host sont falsifiables).
+# Vide → `qr_url` relatif (/qr/<txid>).
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").strip().rstrip("/")
+
 # Autoriser CORS pour les endpoints API (utile si front statique sur un autre domaine)
-# (On évite de l'appliquer au webhook.)
-CORS(app, resources={r"/api/*": {"origins": "*"}})
+# (On évite de l'appliquer au webhook.) Simple test de préfixe : pas de regex par requête.
+@app.after_request
+def _cors(resp):
+    if request.path.startswith("/api/"):
+        resp.headers["Access-Control-Allow-Origin"] = "*"
+        if request.method == "OPTIONS":  # preflight
+            resp.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+            # En-têtes demandés renvoyés tels quels (comme flask-cors) : pas seulement Content-Type
+            req_headers = request.headers.get("Access-Control-Request-Headers")
+            if req_headers:
+                resp.headers["Access-Control-Allow-Headers"] = req_headers
+                resp.vary.add("Access-Control-Request-Headers")
+    return resp
+
+# Preflight sur les seules routes /api réelles : un chemin /api inconnu reste un 404
+def _cors_preflight():
+    return "", 204
+
+for _rule in ("/api/tx-status", "/api/verify", "/api/config", "/api/ping"):
+    app.add_url_rule(_rule, "_cors_preflight", _cors_preflight, methods=["OPTIONS"])
 
 # ───────────────────────── “Mini-DB” en mémoire (exemple) ─────────────────────────
 # Remplace par une vraie base (SQL/NoSQL). Clé = txid (id transaction FedaPay).
-TX_STORE: Dict[str, Dict[str, Any]] = {}
+class TxStore:
+    """
+    Fiches en mémoire, en deux parties :
+    - en attente / inconnues : 16 shards TTLCache bornés (TX_PENDING_TTL, 24 h par défaut),
+      chacun avec son verrou → pas de fuite sur les txid jamais payés ;
+    - payées : dict sans expiration ni éviction (preuve du billet jusqu'à l'événement),
+      alimenté par `mark_paid` dans le worker.
+    Les séquences lecture → mise à jour se font sous `with TX_STORE.lock(txid):`
+    (RLock : get/setdefault ré-entrants).
+    """
+
+    def __init__(self, shards: int = 16, maxsize: int = 8192, ttl: int = 86400):
+        self._shards = [TTLCache(maxsize=maxsize, ttl=ttl) for _ in range(shards)]
+        self._locks = [threading.RLock() for _ in range(shards)]
+        self._mask = shards - 1  # shards = puissance de 2
+        self._paid: Dict[str, Dict[str, Any]] = {}
+
+    def lock(self, txid: str) -> threading.RLock:
+        return self._locks[hash(txid) & self._mask]
+
+    def get(self, txid: str) -> Optional[Dict[str, Any]]:
+        rec = self._paid.get(txid)
+        if rec is not None:
+            return rec
+        i = hash(txid) & self._mask
+        with self._locks[i]:  # TTLCache purge à la lecture : pas thread-safe
+            return self._shards[i].get(txid)
+
+    def setdefault(self, txid: str, default: Dict[str, Any]) -> Dict[str, Any]:
+        i = hash(txid) & self._mask
+        with self._locks[i]:
+            rec = self._paid.get(txid)
+            if rec is not None:
+                return rec
+            return self._shards[i].setdefault(txid, default)
+
+    def mark_paid(self, txid: str, rec: Dict[str, Any]) -> None:
+        """Déplace la fiche vers le store des payées (plus d'expiration ni d'éviction)."""
+        i = hash(txid) & self._mask
+        with self._locks[i]:
+            self._paid[txid] = rec
+            self._shards[i].pop(txid, None)
+
+TX_STORE = TxStore(ttl=int(os.getenv("TX_PENDING_TTL", "86400")))
 # {
 #   txid: {
 #       "status": "pending"|"paid"|"failed",
 #       "amount": 3000, "currency": "XOF",
 #       "nom": "...", "prenom": "...", "email": "...",
-#       "qr_png_b64": "data:image/png;base64,...",  # si paid
+#       "qr_payload": "{...}",                      # si paid (JSON signé du QR)
+#       "qr_png": b"\x89PNG...",                    # rendu par le worker au passage à paid
 #       "ts": "2025-11-07T12:00:00Z",
 #       "sig": "..."   # signature du QR
 #   }
@@ -61,35 +165,84 @@ TX_STORE: Dict[str, Dict[str, Any]] = {}
 # ───────────────────────── Utilitaires QR ─────────────────────────
 MAX_LEN = 280  # limite simple pour éviter les abus
 
+# Échappement JSON des chaînes (équivalent json.dumps(..., ensure_ascii=False))
+_JSON_ESC = str.maketrans({
+    **{chr(i): f"\\u{i:04x}" for i in range(0x20)},
+    "\b": "\\b", "\f": "\\f", "\n": "\\n", "\r": "\\r", "\t": "\\t",
+    '"': '\\"', "\\": "\\\\",
+})
+
+_ts_cache = (0, "")
+
+def _iso_now() -> str:
+    """Horodatage UTC ISO-8601 à la seconde ; reformaté seulement quand la seconde change."""
+    global _ts_cache
+    sec, txt = _ts_cache
+    now = int(time.time())
+    if now != sec:
+        txt = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(now))
+        _ts_cache = (now, txt)  # tuple : lecture/écriture atomiques entre threads
+    return txt
+
+@functools.lru_cache(maxsize=8)
+def _hmac_template(key: bytes):
+    """HMAC-SHA256 pré-clé (ipad/opad calculés une seule fois) — à `.copy()` avant usage."""
+    return hmac.new(key, digestmod=hashlib.sha256)
+
+# Clé BLAKE2b (64 octets max) : une clé plus longue est d'abord condensée
+_QR_B2_KEY = QR_SIGNING_KEY if len(QR_SIGNING_KEY) <= 64 else hashlib.blake2b(QR_SIGNING_KEY).digest()
+
+def _sign_qr(msg: str) -> bytes:
+    """Signature qr_v2 (digest brut) : BLAKE2b-128 à clé (MAC natif en une passe, ~2x plus rapide que HMAC)."""
+    return hashlib.blake2b(msg.encode(), key=_QR_B2_KEY, digest_size=16).digest()
+
+def _sign_qr_v1(msg: str) -> bytes:
+    """Signature qr_v1 (digest brut) : HMAC-SHA256 — gardée pour vérifier les QR déjà émis."""
+    h = _hmac_template(QR_SIGNING_KEY).copy()
+    h.update(msg.encode())
+    return h.digest()
+
 def build_payload(nom: str, prenom: str, txid: Optional[str]) -> str:
     """
-    Construit le JSON encodé dans le QR et le signe (HMAC-SHA256).
+    Construit le JSON encodé dans le QR et le signe (BLAKE2b à clé, kid qr_v2).
     Signature couvre: nom|prenom|txid|ts
     En LIVE, txid est requis.
+    Appelée depuis le worker (hors requête) : champs invalides → ValueError, pas d'abort().
     """
     nom = (nom or "").strip()
     prenom = (prenom or "").strip()
     txid = (txid or "").strip()
 
     if not nom or not prenom:
-        abort(400, "Champs 'nom' et 'prenom' requis")
+        raise ValueError("Champs 'nom' et 'prenom' requis")
     if len(nom) > MAX_LEN or len(prenom) > MAX_LEN:
-        abort(413, "Champs trop longs (max 280 caractères)")
+        raise ValueError("Champs trop longs (max 280 caractères)")
 
     if FEDAPAY_ENV == "live" and not txid:
-        abort(400, "Champ 'txid' requis (id de transaction FedaPay)")
+        raise ValueError("Champ 'txid' requis (id de transaction FedaPay)")
 
-    ts = datetime.utcnow().isoformat() + "Z"
+    ts = _iso_now()
     msg = "|".join([nom, prenom, txid, ts])
-    sig = hmac.new(QR_SIGNING_KEY, msg.encode(), hashlib.sha256).hexdigest()
+    sig = _sign_qr(msg).hex()
 
-    return json.dumps(
-        {"nom": nom, "prenom": prenom, "txid": txid, "ts": ts, "sig": sig, "alg": "HS256", "kid": "qr_v1"},
-        ensure_ascii=False
+    # Schéma fixe → JSON compact construit à la main (pas d'encodeur générique)
+    return (
+        f'{{"nom":"{nom.translate(_JSON_ESC)}","prenom":"{prenom.translate(_JSON_ESC)}",'
+        f'"txid":"{txid.translate(_JSON_ESC)}","ts":"{ts}","sig":"{sig}","alg":"B2b128","kid":"qr_v2"}}'
     )
 
+_PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+def _png_chunk(tag: bytes, data: bytes) -> bytes:
+    """Chunk PNG : longueur | type | données | CRC32(type + données)."""
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+
 def make_qr_png(data: str) -> bytes:
-    """Génère un PNG en mémoire."""
+    """
+    Génère un PNG en mémoire.
+    Encodeur minimal (niveaux de gris 1 bit, IHDR/IDAT/IEND) écrit directement
+    depuis la matrice du QR : ~5x plus rapide que de passer par une image PIL.
+    """
     qr = qrcode.QRCode(
         version=None,
         error_correction=qrcode.constants.ERROR_CORRECT_M,
@@ -98,10 +251,27 @@ def make_qr_png(data: str) -> bytes:
     )
     qr.add_data(data)
     qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    return buf.getvalue()
+
+    matrix = qr.get_matrix()  # inclut déjà la bordure
+    scale = qr.box_size
+    size = len(matrix) * scale
+    row_len = (size + 7) // 8
+    pad = "1" * (row_len * 8 - size)
+    dark, light = "0" * scale, "1" * scale  # 1 bit/pixel : 0 = noir, 1 = blanc
+
+    rows = []
+    for line in matrix:
+        bits = "".join(dark if m else light for m in line) + pad
+        # octet de filtre 0 + ligne, répétée `scale` fois
+        rows.append((b"\x00" + int(bits, 2).to_bytes(row_len, "big")) * scale)
+
+    ihdr = struct.pack(">IIBBBBB", size, size, 1, 0, 0, 0, 0)
+    return (
+        _PNG_SIGNATURE
+        + _png_chunk(b"IHDR", ihdr)
+        + _png_chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+        + _png_chunk(b"IEND", b"")
+    )
 
 def make_qr_svg(data: str) -> bytes:
     """Génère un SVG minifié."""
@@ -111,9 +281,33 @@ def make_qr_svg(data: str) -> bytes:
     img.save(buf)
     return buf.getvalue()
 
-def png_bytes_to_data_url(png_bytes: bytes) -> str:
-    b64 = base64.b64encode(png_bytes).decode()
-    return f"data:image/png;base64,{b64}"
+# Rendus mémoïsés (génération pure et déterministe, bytes immuables ~1-3 Ko par entrée)
+_QR_PNG_CACHE: LRUCache = LRUCache(maxsize=512)
+_QR_PNG_LOCK = threading.Lock()
+# Plafond d'encodages QR (CPU) simultanés par process : attente courte, puis 503 + Retry-After
+QR_RENDER_SLOTS = threading.BoundedSemaphore(int(os.getenv("QR_MAX_CONCURRENT", "2")))
+QR_RENDER_WAIT = float(os.getenv("QR_RENDER_WAIT", "2"))
+
+def _encode_qr_png(data: str) -> bytes:
+    """Encode le PNG sous QR_RENDER_SLOTS ; 503 (Retry-After) si aucun créneau ne se libère à temps."""
+    if not QR_RENDER_SLOTS.acquire(timeout=QR_RENDER_WAIT):
+        raise ServiceUnavailable("Génération du QR indisponible, réessayez", retry_after=1)
+    try:
+        return make_qr_png(data)
+    finally:
+        QR_RENDER_SLOTS.release()
+
+def render_qr_png(data: str) -> bytes:
+    """PNG du QR : servi depuis le cache si possible, sinon encodé sous QR_RENDER_SLOTS (503 si saturé)."""
+    with _QR_PNG_LOCK:
+        png = _QR_PNG_CACHE.get(data)
+    if png is not None:
+        return png
+    png = _encode_qr_png(data)
+    with _QR_PNG_LOCK:
+        _QR_PNG_CACHE[data] = png
+    return png
+
 
 # ───────────────────────── Pages de test (facultatif) ─────────────────────────
 INDEX = """
@@ -142,15 +336,32 @@ INDEX = """
 </html>
 """
 
+# INDEX ne dépend que de CALLBACK_URL (constante) → rendu et encodé une seule fois au chargement
+_INDEX_HTML = app.jinja_env.from_string(INDEX).render(cb=CALLBACK_URL).encode()
+
 @app.get("/")
 def index():
-    return render_template_string(INDEX, cb=CALLBACK_URL)
+    return app.response_class(_INDEX_HTML, mimetype="text/html")
 
 # ───────────────────────── Helpers de parsing ─────────────────────────
+def _as_dict(value: Any) -> Dict[str, Any]:
+    """Objet JSON attendu : toute autre forme (liste, chaîne, nombre, null) → {}."""
+    return value if isinstance(value, dict) else {}
+
+def _as_int(value: Any) -> int:
+    try:
+        return int(value or 0)
+    except (TypeError, ValueError):
+        return 0
+
 def _extract_currency(tx_currency) -> str:
     if isinstance(tx_currency, dict):
-        return (tx_currency.get("iso") or tx_currency.get("code") or "").upper()
-    return (tx_currency or "").upper()
+        return str(tx_currency.get("iso") or tx_currency.get("code") or "").upper()
+    return str(tx_currency or "").upper()
+
+def _clean_name(value: Any) -> str:
+    """Nom/prénom venant du webhook : texte, sans espaces de bord, tronqué à MAX_LEN."""
+    return str(value or "").strip()[:MAX_LEN].rstrip()
 
 def _extract_txid(tx_obj: dict) -> str:
     # Essaye divers champs possibles pour la robustesse
@@ -162,6 +373,8 @@ def _extract_txid(tx_obj: dict) -> str:
     ).strip()
 
 # ───────────────────────── Webhook utils (signature HMAC) ─────────────────────────
+_SIG_HEADER_KEYS = frozenset({"t", "v1", "signature", "sig"})
+
 def _parse_sig_header(sig_header: str):
     """
     Supporte un header brut ou structuré (ex: 't=...,v1=...').
@@ -170,8 +383,8 @@ def _parse_sig_header(sig_header: str):
     if not sig_header:
         return None, None
     h = sig_header.strip()
-    if "=" not in h:
-        return None, h  # valeur brute
+    if h.partition("=")[0].strip() not in _SIG_HEADER_KEYS:
+        return None, h  # valeur brute (hex, ou Base64 dont le '=' final n'est que du padding)
     parts = {}
     for chunk in h.split(","):
         if "=" in chunk:
@@ -193,17 +406,81 @@ def _verify_signature(raw_body: bytes, signature_header: str, secret: str) -> bo
     if not provided:
         return False
 
-    mac = hmac.new(secret.encode(), raw_body, hashlib.sha256).digest()
-    expected_hex = mac.hex()
-    expected_b64 = base64.b64encode(mac).decode().strip()
-
+    # SHA-256 = 64 car. en hex, 44 en Base64 : toute autre longueur est rejetée sans calcul
     provided_clean = provided.strip().strip('"').strip("'")
-    return (
-        hmac.compare_digest(provided_clean, expected_hex) or
-        hmac.compare_digest(provided_clean, expected_b64)
-    )
+    if len(provided_clean) not in (64, 44):
+        return False
+
+    # Décode la signature fournie et compare les 32 octets bruts du digest
+    try:
+        if len(provided_clean) == 64:
+            provided_raw = bytes.fromhex(provided_clean)
+        else:
+            provided_raw = base64.b64decode(provided_clean, validate=True)
+    except ValueError:
+        return False
+
+    h = _hmac_template(secret.encode()).copy()
+    h.update(raw_body)
+    return hmac.compare_digest(h.digest(), provided_raw)
+
+# ───────────────────────── Tâches de fond (après webhook) ─────────────────────────
+# File bornée + worker unique : le webhook rend la main dès la signature vérifiée.
+WORK_Q: "queue.Queue[tuple]" = queue.Queue(maxsize=int(os.getenv("WORK_QUEUE_SIZE", "1000")))
+_worker_lock = threading.Lock()
+_worker_thread: Optional[threading.Thread] = None
+
+def _finalize_paid(txid: str, nom: str, prenom: str) -> None:
+    """Construit le QR avec txid signé et le range en “DB”."""
+    with TX_STORE.lock(txid):
+        rec = TX_STORE.setdefault(txid, {})
+        if rec.get("status") == "paid" and rec.get("qr_payload"):
+            return  # doublon déjà en file avant la première génération
+
+        # PNG rendu ici, avant le passage à "paid" : /qr/<txid> le sert tel quel, sans
+        # disputer QR_RENDER_SLOTS aux autres requêtes (un <img> ne réessaie pas un 503)
+        qr_json = build_payload(nom, prenom, txid)
+        obj = orjson.loads(qr_json)
+        rec.update({
+            "status": "paid",
+            "qr_payload": qr_json,
+            "qr_png": make_qr_png(qr_json),
+            "ts": obj["ts"],
+            "sig": obj["sig"]
+        })
+        rec.pop("paid_json", None)
+        TX_STORE.mark_paid(txid, rec)
+
+    app.logger.info(f"[Worker] ✅ QR généré (txid={txid})")
+    # TODO: envoyer par email si souhaité (attachment png)
+
+def _worker():
+    while True:
+        txid, nom, prenom = WORK_Q.get()
+        try:
+            _finalize_paid(txid, nom, prenom)
+        except Exception:
+            app.logger.exception(f"[Worker] ❌ échec de génération du QR (txid={txid})")
+        finally:
+            WORK_Q.task_done()
+
+def _ensure_worker():
+    """
+    Démarre le worker à la première utilisation (et non à l'import) :
+    avec preload_app, un thread lancé dans le master n'existerait pas dans les workers forkés.
+    """
+    global _worker_thread
+    if _worker_thread is not None and _worker_thread.is_alive():
+        return
+    with _worker_lock:
+        if _worker_thread is None or not _worker_thread.is_alive():
+            _worker_thread = threading.Thread(target=_worker, name="webhook-worker", daemon=True)
+            _worker_thread.start()
 
 # ───────────────────────── Webhook FedaPay ─────────────────────────
+PAID_STATUSES = frozenset({"approved", "paid", "success", "completed"})
+ACCEPTED_CURRENCIES = frozenset({"XOF", "CFA", "FCFA"})
+
 @app.post("/webhook/fedapay")
 def webhook_fedapay():
     """
@@ -217,57 +494,62 @@ def webhook_fedapay():
         app.logger.warning(f"[Webhook] ❌ signature invalide recv='{(signature or '')[:24]}...'")
         return jsonify({"ok": False, "error": "invalid_signature"}), 401
 
-    # 2) Payload JSON
-    payload = request.get_json(silent=True) or {}
-    event = (payload.get("event") or "").lower()
-    data = payload.get("data") or {}
-    tx = data.get("object") or {}
-
-    status = (tx.get("status") or "").lower()
-    amount = int(tx.get("amount") or 0)
+    # 2) Payload JSON — parsé une seule fois depuis le corps brut déjà lu
+    #    (get_data(cache=False) a consommé le flux : get_json ne verrait plus rien)
+    #    Corps signé mais de forme inattendue → traité comme vide (200), pas de 500 rejoué
+    try:
+        payload = _as_dict(orjson.loads(raw))
+    except orjson.JSONDecodeError:
+        payload = {}
+    event = str(payload.get("event") or "").lower()
+    data = _as_dict(payload.get("data"))
+    tx = _as_dict(data.get("object"))
+
+    status = str(tx.get("status") or "").lower()
+    amount = _as_int(tx.get("amount"))
     currency = _extract_currency(tx.get("currency"))
 
     txid = _extract_txid(tx)
-    customer = tx.get("customer") or {}
-    prenom = (customer.get("first_name") or "").strip() or (tx.get("metadata", {}) or {}).get("prenom") or "Inconnu"
-    nom    = (customer.get("last_name")  or "").strip() or (tx.get("metadata", {}) or {}).get("nom")    or "Inconnu"
-    email  = (tx.get("metadata", {}) or {}).get("email") or ""
+    customer = _as_dict(tx.get("customer"))
+    metadata = _as_dict(tx.get("metadata"))  # lu une fois (au lieu de 3)
+    # Validés ici (et non dans le worker) : build_payload ne peut plus échouer en tâche de fond
+    prenom = _clean_name(customer.get("first_name")) or _clean_name(metadata.get("prenom")) or "Inconnu"
+    nom    = _clean_name(customer.get("last_name"))  or _clean_name(metadata.get("nom"))    or "Inconnu"
+    email  = str(metadata.get("email") or "")
 
     app.logger.info(f"[Webhook] event={event} status={status} amount={amount} {currency} txid={txid} {nom} {prenom}")
 
-    paid_ok  = status in {"approved", "paid", "success", "completed"}
-    money_ok = (amount == EVENT_PRICE_XOF and currency in {"XOF", "CFA", "FCFA"})
+    paid_ok  = status in PAID_STATUSES
+    money_ok = (amount == EVENT_PRICE_XOF and currency in ACCEPTED_CURRENCIES)
 
     # Initialise/complète la fiche en mémoire
-    rec = TX_STORE.setdefault(txid or "unknown", {
-        "status": "pending",
-        "amount": amount,
-        "currency": currency,
-        "nom": nom, "prenom": prenom, "email": email
-    })
-    rec.update({
-        "amount": amount or rec.get("amount"),
-        "currency": currency or rec.get("currency"),
-        "nom": nom, "prenom": prenom, "email": email
-    })
-
-    if event == "transaction.approved" and paid_ok and money_ok and txid:
-        # Construire le QR avec txid signé
-        qr_json = build_payload(nom, prenom, txid)
-        png = make_qr_png(qr_json)
-        qr_data_url = png_bytes_to_data_url(png)
-
-        # Sauvegarder en “DB”
-        obj = json.loads(qr_json)
+    key = txid or "unknown"
+    with TX_STORE.lock(key):
+        rec = TX_STORE.setdefault(key, {
+            "status": "pending",
+            "amount": amount,
+            "currency": currency,
+            "nom": nom, "prenom": prenom, "email": email
+        })
+        # Re-livraison (FedaPay réessaie) d'une transaction déjà traitée : rien à refaire
+        if rec.get("status") == "paid" and rec.get("qr_payload"):
+            return jsonify({"ok": True})
         rec.update({
-            "status": "paid",
-            "qr_png_b64": qr_data_url,
-            "ts": obj["ts"],
-            "sig": obj["sig"]
+            "amount": amount or rec.get("amount"),
+            "currency": currency or rec.get("currency"),
+            "nom": nom, "prenom": prenom, "email": email
         })
 
-        app.logger.info(f"[Webhook] ✅ Paiement validé — QR généré (txid={txid})")
-        # TODO: envoyer par email si souhaité (attachment png)
+    if event == "transaction.approved" and paid_ok and money_ok and txid:
+        # QR (+ email) générés en tâche de fond : on répond à FedaPay sans attendre
+        _ensure_worker()
+        try:
+            WORK_Q.put_nowait((txid, nom, prenom))
+        except queue.Full:
+            app.logger.warning(f"[Webhook] ❌ file de travail pleine (txid={txid})")
+            return jsonify({"ok": False, "error": "busy"}), 503  # FedaPay réessaiera
+
+        app.logger.info(f"[Webhook] ✅ Paiement validé — QR en file (txid={txid})")
     else:
         app.logger.info("[Webhook] ⚠️ Conditions non réunies pour émission du QR")
 
@@ -275,12 +557,28 @@ def webhook_fedapay():
     return jsonify({"ok": True})
 
 # ───────────────────────── API de polling (page retour) ─────────────────────────
+# Politiques de cache, partagées entre la réponse 200 et son 304
+_CC_TX_STATUS = "private, max-age=0, must-revalidate"
+_CC_TX_QR = "private, max-age=31536000"  # QR figé une fois payé, mais c'est un billet
+_CC_PREVIEW_QR = "public, max-age=3600"
+
+def _not_modified(etag: str, cache_control: str):
+    """
+    Réponse 304 (If-None-Match satisfait) : en-têtes seuls, pas de corps.
+    Reprend le Cache-Control de la réponse 200, sinon le cache perdrait sa durée de vie.
+    """
+    resp = app.response_class(status=304)
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = cache_control
+    return resp
+
 @app.get("/api/tx-status")
 def api_tx_status():
     """
     FRONT → BACK (page callback)
     Le front interroge /api/tx-status?id=TXID jusqu'à {status: "paid"}.
-    Si paid → renvoie aussi le QR (data URL) pour affichage direct.
+    Si paid → renvoie aussi `qr_url` (/qr/<txid>, PNG) pour affichage direct, préfixé par
+    PUBLIC_BASE_URL s'il est configuré (front servi depuis un autre domaine).
     """
     txid = (request.args.get("id") or "").strip()
     if not txid:
@@ -291,32 +589,67 @@ def api_tx_status():
         return jsonify({"status": "pending"}), 200  # Le webhook peut ne pas avoir encore alimenté
 
     if rec.get("status") == "paid":
-        return jsonify({
-            "status": "paid",
-            "nom": rec.get("nom"),
-            "prenom": rec.get("prenom"),
-            "amount": rec.get("amount"),
-            "currency": rec.get("currency"),
-            "qr_data_url": rec.get("qr_png_b64"),
-            "txid": txid,
-            "ts": rec.get("ts"),
-        })
+        # Fiche payée figée : la signature du QR identifie la réponse → 304 au polling suivant
+        etag = rec["sig"][:16]
+        if etag in request.if_none_match:
+            return _not_modified(etag, _CC_TX_STATUS)
+
+        # Le polling relit la même fiche : corps JSON sérialisé une fois puis réutilisé
+        # (fiche payée jamais modifiée : les re-livraisons du webhook s'arrêtent avant).
+        # Le corps ne dépend que de la fiche et de la config : rien tiré de la requête (Host…)
+        body = rec.get("paid_json")
+        if body is None:
+            body = rec["paid_json"] = orjson.dumps({
+                "status": "paid",
+                "nom": rec.get("nom"),
+                "prenom": rec.get("prenom"),
+                "amount": rec.get("amount"),
+                "currency": rec.get("currency"),
+                "qr_url": PUBLIC_BASE_URL + url_for("tx_qr", txid=txid),
+                "txid": txid,
+                "ts": rec.get("ts"),
+            })
+        resp = app.response_class(body, mimetype="application/json")
+        resp.set_etag(etag)
+        resp.headers["Cache-Control"] = _CC_TX_STATUS
+        return resp
 
     return jsonify({"status": rec.get("status", "pending")})
 
+@app.get("/qr/<txid>")
+def tx_qr(txid: str):
+    """
+    GET /qr/<txid> → PNG brut du QR d'une transaction payée (lien `qr_url` de /api/tx-status).
+    Évite le data URL base64 (+33 %) dans le JSON de polling ; PNG déjà rendu par le worker.
+    """
+    rec = TX_STORE.get(txid)
+    if not rec or rec.get("status") != "paid":
+        abort(404, "QR indisponible")
+
+    etag = rec["sig"][:16]
+    if etag in request.if_none_match:
+        return _not_modified(etag, _CC_TX_QR)
+
+    png = rec["qr_png"]
+
+    # QR figé une fois payé → cache navigateur long, mais privé (c'est un billet)
+    resp = send_file(io.BytesIO(png), mimetype="image/png", download_name="qr.png", etag=etag)
+    resp.headers["Cache-Control"] = _CC_TX_QR
+    return resp
+
 # ───────────────────────── Vérification de QR (contrôle d'accès) ─────────────────────────
 @app.post("/api/verify")
 def api_verify():
     """
     Contrôle d'accès à l'événement : vérifier un QR scanné.
     body: {"qr_text": "..."} (contenu texte JSON du QR)
-    - vérifie la signature HMAC
+    - vérifie la signature (qr_v2 BLAKE2b, ou qr_v1 HMAC pour les anciens QR)
     - valide que le txid est 'paid' en DB
     """
     payload = request.get_json(silent=True) or {}
     qr_text = payload.get("qr_text") or ""
     try:
-        obj = json.loads(qr_text)
+        obj = orjson.loads(qr_text)
         nom = (obj.get("nom") or "").strip()
         prenom = (obj.get("prenom") or "").strip()
         txid = (obj.get("txid") or "").strip()
@@ -327,8 +660,9 @@ def api_verify():
             abort(400, "Champs manquants dans le QR")
 
         msg = "|".join([nom, prenom, txid, ts])
-        expected = hmac.new(QR_SIGNING_KEY, msg.encode(), hashlib.sha256).hexdigest()
-        if not hmac.compare_digest(expected, sig):
+        expected = _sign_qr(msg) if obj.get("kid") == "qr_v2" else _sign_qr_v1(msg)
+        # Comparaison sur les octets bruts (moitié moins long que l'hex)
+        if not hmac.compare_digest(expected, bytes.fromhex(sig)):
             abort(401, "Signature du QR invalide")
 
         rec = TX_STORE.get(txid)
@@ -337,6 +671,8 @@ def api_verify():
 
         # TODO (anti double-scan): marquer 'scanned_at' et refuser si déjà scanné
         return jsonify({"ok": True, "nom": nom, "prenom": prenom, "txid": txid, "ts": ts})
+    except HTTPException:
+        raise  # 400/401/403 ci-dessus : code d'origine conservé
     except Exception:
         abort(400, "QR invalide")
 
@@ -347,23 +683,47 @@ def preview_qr():
     text = (request.args.get("text") or "").strip()
     if not text:
         abort(400, "Paramètre 'text' requis")
-    png = make_qr_png(text)
-    return send_file(io.BytesIO(png), mimetype="image/png", download_name="qr.png")
+
+    # Le PNG est une fonction pure de `text` → ETag stable ; 304 sans régénérer
+    etag = hashlib.blake2b(text.encode(), digest_size=12).hexdigest()
+    if etag in request.if_none_match:
+        return _not_modified(etag, _CC_PREVIEW_QR)
+
+    png = render_qr_png(text)
+    resp = send_file(io.BytesIO(png), mimetype="image/png", download_name="qr.png", etag=etag)
+    resp.headers["Cache-Control"] = _CC_PREVIEW_QR
+    return resp
+
+# Corps JSON des endpoints de service encodés une seule fois (sondés en boucle)
+_CONFIG_BODY = orjson.dumps({"currency": EVENT_CURRENCY, "price_xof": EVENT_PRICE_XOF, "env": FEDAPAY_ENV})
+_HEALTH_BODY = orjson.dumps({"status": "ok"})
+_ping_cache = ("", b"")
 
 @app.get("/api/config")
 def api_config():
-    return {"currency": EVENT_CURRENCY, "price_xof": EVENT_PRICE_XOF, "env": FEDAPAY_ENV}
+    return app.response_class(_CONFIG_BODY, mimetype="application/json")
 
 @app.get("/api/ping")
 def ping():
-    return {"ok": True, "ts": datetime.utcnow().isoformat() + "Z"}
+    # Seul `ts` varie, à la seconde : corps ré-encodé une fois par seconde au plus
+    global _ping_cache
+    ts = _iso_now()
+    cached_ts, body = _ping_cache
+    if ts != cached_ts:
+        body = orjson.dumps({"ok": True, "ts": ts})
+        _ping_cache = (ts, body)
+    return app.response_class(body, mimetype="application/json")
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return app.response_class(_HEALTH_BODY, mimetype="application/json")
+
+# Compile la table de routage dès l'import (avec preload_app : une seule fois, dans le master)
+app.url_map.update()
 
 # ───────────────────────── Entrée applicative ─────────────────────────
 if __name__ == "__main__":
     print("==> Backend timeline prêt : http://127.0.0.1:5000 (Ctrl+C pour arrêter)")
-    # ⚠️ En prod: debug=False, derrière un WSGI (gunicorn) + reverse-proxy (Nginx/Caddy)
-    app.run(host="127.0.0.1", port=5000, debug=True, use_reloader=False)
+    # ⚠️ En prod: gunicorn (voir gunicorn.conf.py) + reverse-proxy (Nginx/Caddy).
+    # Le debugger Werkzeug ralentit chaque requête : seulement si FLASK_DEBUG=1
+    app.run(host="127.0.0.1", port=5000, debug=os.getenv("FLASK_DEBUG") == "1", use_reloader=False)
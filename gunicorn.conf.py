@@ -0,0 +1,18 @@
+# Configuration Gunicorn (chargée automatiquement depuis le dossier courant)
+# Lancement : gunicorn app:app
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+
+# 1 worker par défaut (surchargeable via WEB_CONCURRENCY), la concurrence passe par
+# les threads. Pas de cpu_count() : TX_STORE, WORK_Q et le worker QR sont en mémoire,
+# propres à chaque process (un webhook reçu par un worker est invisible des autres
+# pour /api/tx-status), et en conteneur cpu_count() renvoie les cœurs de l'hôte.
+# Monter à 2+ seulement une fois le store partagé (Redis/SQL).
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+# Import de l'app (table de routage compilée, page d'accueil rendue) une seule fois
+# dans le master, puis partagé en copy-on-write avec les workers après fork()
+preload_app = True
@@ -0,0 +1,269 @@
+import io
+import hmac
+import time
+import threading
+import base64
+import hashlib
+
+import orjson
+import pytest
+import qrcode
+
+import app as m
+
+
+@pytest.fixture
+def client():
+    return m.app.test_client()
+
+@pytest.fixture(autouse=True)
+def tx_store(monkeypatch):
+    """TX_STORE neuf par test : les fiches payées ne fuient pas d'un test à l'autre."""
+    store = m.TxStore()
+    monkeypatch.setattr(m, "TX_STORE", store)
+    return store
+
+def _hmac(secret: str, body: bytes) -> bytes:
+    return hmac.new(secret.encode(), body, hashlib.sha256).digest()
+
+# ───────────────────────── Signature webhook ─────────────────────────
+BODY = b'{"event":"transaction.approved"}'
+SECRET = "wh_test_secret"
+
+def test_webhook_signature_hex_valid():
+    assert m._verify_signature(BODY, _hmac(SECRET, BODY).hex(), SECRET)
+
+def test_webhook_signature_structured_and_base64_valid():
+    sig = _hmac(SECRET, BODY)
+    assert m._verify_signature(BODY, f"t=1700000000,v1={sig.hex()}", SECRET)
+    assert m._verify_signature(BODY, base64.b64encode(sig).decode(), SECRET)
+
+def test_webhook_signature_hex_invalid():
+    sig = _hmac(SECRET, BODY).hex()
+    tampered = ("1" if sig[0] == "0" else "0") + sig[1:]
+    assert not m._verify_signature(BODY, tampered, SECRET)
+    assert not m._verify_signature(BODY + b" ", sig, SECRET)
+    assert not m._verify_signature(BODY, "zz" * 32, SECRET)  # hex non décodable
+
+def test_webhook_signature_wrong_length():
+    sig = _hmac(SECRET, BODY).hex()
+    assert not m._verify_signature(BODY, sig[:-1], SECRET)
+    assert not m._verify_signature(BODY, sig + "0", SECRET)
+    assert not m._verify_signature(BODY, "", SECRET)
+
+# ───────────────────────── Payload du QR ─────────────────────────
+@pytest.mark.parametrize("nom, prenom", [
+    ('O"Brien', "Jean \\ Luc"),
+    ("Nul\x00l", "Tab\tNew\nline\r\x1f\x08\x0c fin"),
+    ("Éloïse", "Zoé 🎟️ «ticket»"),
+])
+def test_build_payload_round_trip(nom, prenom):
+    obj = orjson.loads(m.build_payload(nom, prenom, "tx-42"))
+    assert (obj["nom"], obj["prenom"], obj["txid"]) == (nom, prenom, "tx-42")
+    assert (obj["alg"], obj["kid"]) == ("B2b128", "qr_v2")
+    msg = "|".join([nom, prenom, "tx-42", obj["ts"]])
+    assert bytes.fromhex(obj["sig"]) == m._sign_qr(msg)
+
+def test_build_payload_rejects_invalid_fields():
+    with pytest.raises(ValueError):
+        m.build_payload("", "Jean", "tx-42")
+    with pytest.raises(ValueError):
+        m.build_payload("x" * (m.MAX_LEN + 1), "Jean", "tx-42")
+
+# ───────────────────────── /api/verify ─────────────────────────
+def _mark_paid(txid: str) -> None:
+    m.TX_STORE.mark_paid(txid, {"status": "paid"})
+
+def test_verify_qr_v2(client):
+    _mark_paid("tx-v2")
+    qr_text = m.build_payload("Dupont", "Jean", "tx-v2")
+    r = client.post("/api/verify", json={"qr_text": qr_text})
+    assert r.status_code == 200
+    assert r.get_json()["txid"] == "tx-v2"
+
+def test_verify_qr_v1(client):
+    _mark_paid("tx-v1")
+    ts = "2025-01-01T00:00:00Z"
+    msg = "|".join(["Dupont", "Jean", "tx-v1", ts])
+    sig = hmac.new(m.QR_SIGNING_KEY, msg.encode(), hashlib.sha256).hexdigest()
+    qr_text = orjson.dumps({
+        "nom": "Dupont", "prenom": "Jean", "txid": "tx-v1", "ts": ts,
+        "sig": sig, "alg": "HS256", "kid": "qr_v1",
+    }).decode()
+    r = client.post("/api/verify", json={"qr_text": qr_text})
+    assert r.status_code == 200
+
+def test_verify_rejects_bad_signature(client):
+    _mark_paid("tx-bad")
+    obj = orjson.loads(m.build_payload("Dupont", "Jean", "tx-bad"))
+    obj["sig"] = ("1" if obj["sig"][0] == "0" else "0") + obj["sig"][1:]
+    r = client.post("/api/verify", json={"qr_text": orjson.dumps(obj).decode()})
+    assert r.status_code == 401
+
+def test_verify_rejects_unpaid(client):
+    qr_text = m.build_payload("Dupont", "Jean", "tx-unpaid")
+    r = client.post("/api/verify", json={"qr_text": qr_text})
+    assert r.status_code == 403
+
+def test_verify_rejects_malformed(client):
+    assert client.post("/api/verify", json={"qr_text": "pas du json"}).status_code == 400
+    assert client.post("/api/verify", json={"qr_text": '{"nom":"Dupont"}'}).status_code == 400
+
+# ───────────────────────── Encodeur PNG ─────────────────────────
+@pytest.mark.parametrize("data", ["hello", m.build_payload("Dupont", "Jean", "tx-png")])
+def test_png_matches_pil_rendering(data):
+    Image = pytest.importorskip("PIL.Image")
+    from qrcode.image.pil import PilImage
+
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=10, border=2)
+    qr.add_data(data)
+    qr.make(fit=True)
+    expected = qr.make_image(image_factory=PilImage).get_image().convert("1")
+
+    ours = Image.open(io.BytesIO(m.make_qr_png(data)))
+    ours.load()
+    assert ours.size == expected.size
+    assert ours.convert("1").tobytes() == expected.tobytes()
+
+# ───────────────────────── Webhook → file → QR ─────────────────────────
+def _webhook(client, txid=555, event="transaction.approved", **fields):
+    tx = {
+        "id": txid, "status": "approved", "amount": m.EVENT_PRICE_XOF, "currency": {"iso": "XOF"},
+        "customer": {"first_name": "Jean", "last_name": "Dupont"}, "metadata": {},
+    }
+    tx.update(fields)
+    raw = orjson.dumps({"event": event, "data": {"object": tx}})
+    sig = _hmac(m.FEDAPAY_WEBHOOK_SECRET, raw).hex()
+    r = client.post("/webhook/fedapay", data=raw, headers={"X-FEDAPAY-SIGNATURE": sig})
+    m.WORK_Q.join()  # attend le worker (_finalize_paid)
+    return r
+
+def test_webhook_issues_ticket(client):
+    assert _webhook(client).status_code == 200
+    body = client.get("/api/tx-status?id=555").get_json()
+    assert body["status"] == "paid"
+    assert (body["nom"], body["prenom"], body["qr_url"]) == ("Dupont", "Jean", "/qr/555")
+
+    rec = m.TX_STORE.get("555")
+    r = client.post("/api/verify", json={"qr_text": rec["qr_payload"]})
+    assert r.status_code == 200
+
+def test_webhook_redelivery_keeps_first_ticket(client, tx_store):
+    _webhook(client)
+    first = dict(tx_store.get("555"))
+    assert _webhook(client, customer={"first_name": "Autre", "last_name": "Nom"}).status_code == 200
+    rec = tx_store.get("555")
+    assert (rec["sig"], rec["qr_payload"], rec["nom"]) == (first["sig"], first["qr_payload"], "Dupont")
+
+def test_webhook_truncates_long_names(client, tx_store):
+    _webhook(client, customer={"first_name": "  " + "é" * 500, "last_name": 12345})
+    rec = tx_store.get("555")
+    assert rec["status"] == "paid"
+    assert (len(rec["prenom"]), rec["nom"]) == (m.MAX_LEN, "12345")
+
+def test_webhook_wrong_amount_stays_pending(client, tx_store):
+    assert _webhook(client, amount=m.EVENT_PRICE_XOF + 1).status_code == 200
+    assert tx_store.get("555")["status"] == "pending"
+    assert client.get("/api/tx-status?id=555").get_json() == {"status": "pending"}
+
+@pytest.mark.parametrize("raw", [
+    b"[1,2]", b'"x"', b"null", b"pas du json",
+    b'{"data":{"object":{"customer":"x"}}}',
+    b'{"data":[1],"event":3}',
+    b'{"data":{"object":{"amount":"abc","currency":7,"status":1,"metadata":[]}}}',
+])
+def test_webhook_unexpected_shape_is_ignored(client, raw):
+    sig = _hmac(m.FEDAPAY_WEBHOOK_SECRET, raw).hex()
+    r = client.post("/webhook/fedapay", data=raw, headers={"X-FEDAPAY-SIGNATURE": sig})
+    assert r.status_code == 200
+
+def test_webhook_rejects_bad_signature(client, tx_store):
+    r = client.post("/webhook/fedapay", data=b"{}", headers={"X-FEDAPAY-SIGNATURE": "00" * 32})
+    assert r.status_code == 401
+    assert tx_store.get("unknown") is None
+
+# ───────────────────────── TxStore ─────────────────────────
+def test_tx_store_pending_expires_paid_stays():
+    store = m.TxStore(ttl=0.05)
+    store.setdefault("pending", {"status": "pending"})
+    rec = store.setdefault("paid", {"status": "pending"})
+    rec["status"] = "paid"
+    store.mark_paid("paid", rec)
+    time.sleep(0.1)
+    assert store.get("pending") is None
+    assert store.get("paid") is rec
+    assert store.setdefault("paid", {}) is rec
+
+# ───────────────────────── Cache HTTP (ETag / 304) ─────────────────────────
+def test_tx_status_etag_and_304(client):
+    _webhook(client)
+    r = client.get("/api/tx-status?id=555")
+    assert r.headers["Cache-Control"] == "private, max-age=0, must-revalidate"
+    r2 = client.get("/api/tx-status?id=555", headers={"If-None-Match": r.headers["ETag"]})
+    assert r2.status_code == 304 and r2.data == b""
+    assert (r2.headers["ETag"], r2.headers["Cache-Control"]) == (r.headers["ETag"], r.headers["Cache-Control"])
+
+def test_tx_status_body_independent_of_request_host(client, monkeypatch):
+    monkeypatch.setattr(m, "PUBLIC_BASE_URL", "https://api.legit.example")
+    _webhook(client)
+    forged = client.get("/api/tx-status?id=555", base_url="https://evil.example",
+                        headers={"X-Forwarded-Host": "evil.example"})
+    legit = client.get("/api/tx-status?id=555", base_url="https://api.legit.example")
+    assert forged.data == legit.data
+    assert legit.get_json()["qr_url"] == "https://api.legit.example/qr/555"
+
+def test_tx_qr_png_etag_and_304(client):
+    _webhook(client)
+    r = client.get("/qr/555")
+    assert r.status_code == 200 and r.mimetype == "image/png"
+    assert r.data.startswith(b"\x89PNG")
+    assert r.headers["Cache-Control"] == "private, max-age=31536000"
+    r2 = client.get("/qr/555", headers={"If-None-Match": r.headers["ETag"]})
+    assert r2.status_code == 304
+    assert r2.headers["Cache-Control"] == r.headers["Cache-Control"]
+
+def test_qr_render_slots_saturated(client, monkeypatch):
+    _webhook(client)
+    slots = threading.BoundedSemaphore(1)
+    slots.acquire()  # créneaux tous pris
+    monkeypatch.setattr(m, "QR_RENDER_SLOTS", slots)
+    monkeypatch.setattr(m, "QR_RENDER_WAIT", 0.01)
+    assert client.get("/qr/555").status_code == 200  # PNG déjà rendu par le worker
+    r = client.get("/qr?text=sature")
+    assert r.status_code == 503
+    assert r.headers["Retry-After"] == "1"
+
+def test_tx_qr_404_unless_paid(client):
+    _webhook(client, amount=m.EVENT_PRICE_XOF + 1)
+    assert client.get("/qr/555").status_code == 404
+    assert client.get("/qr/inconnu").status_code == 404
+
+# ───────────────────────── Routage / CORS ─────────────────────────
+def test_cors_preflight_on_api_routes(client):
+    r = client.options("/api/verify", headers={
+        "Origin": "https://front.example", "Access-Control-Request-Method": "POST",
+    })
+    assert r.status_code == 204
+    assert r.headers["Access-Control-Allow-Origin"] == "*"
+    assert "POST" in r.headers["Access-Control-Allow-Methods"]
+
+def test_cors_preflight_echoes_requested_headers(client):
+    r = client.options("/api/verify", headers={
+        "Origin": "https://front.example", "Access-Control-Request-Method": "POST",
+        "Access-Control-Request-Headers": "content-type, x-requested-with, authorization",
+    })
+    assert r.headers["Access-Control-Allow-Headers"] == "content-type, x-requested-with, authorization"
+    assert "Access-Control-Request-Headers" in r.headers["Vary"]
+
+def test_cors_only_on_api(client):
+    assert client.get("/api/config").headers["Access-Control-Allow-Origin"] == "*"
+    assert "Access-Control-Allow-Origin" not in client.get("/health").headers
+    assert client.options("/webhook/fedapay").status_code == 405
+
+def test_unknown_api_path_is_404(client):
+    assert client.get("/api/nope").status_code == 404
+    assert client.options("/api/nope").status_code == 404
+
+def test_trailing_slash_not_redirected(client):
+    assert client.get("/api/config/").status_code == 200
+    assert client.get("/health/").status_code == 200